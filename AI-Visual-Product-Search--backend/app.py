@@ -2,43 +2,64 @@
 
 import os
 import bcrypt
+import hashlib
+import heapq
+import atexit
 import asyncio
+import concurrent.futures
+import threading
 import aiohttp
-from utils import clean_search_term
+import orjson
+import ahocorasick
+from utils import clean_search_term, downscale_image, HTTP_PREFIXES
 import re  # For regex operations
 import logging  # For logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from dotenv import load_dotenv  # For loading environment variables
 from scrapers import EbaySearcher
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response
+from flask.json.provider import JSONProvider
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_restful import Api, Resource
 from flask_cors import CORS  # For handling CORS
+from flask_compress import Compress  # For gzip/br response compression
 from flask_jwt_extended import (
     JWTManager, create_access_token, create_refresh_token,
     jwt_required, get_jwt_identity
 )
 from waitress import serve
+from cachetools import TTLCache
 from pymongo import MongoClient
-from werkzeug.utils import secure_filename
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId, Decimal128
 from datetime import datetime, timedelta
-from typing import List, Dict
-
-import google.cloud.vision as vision
-import json
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
+from typing import List, Dict, Optional, Tuple
+from operator import itemgetter
 
 ###############################################################################
 # LOGGING SETUP
 ###############################################################################
+_log_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+_log_handlers = [
+    logging.FileHandler("app.log"),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
+# Request threads only enqueue records; a background listener does the file/stream writes
+_log_queue = queue.Queue(-1)
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Final layout is applied by _log_handlers
 logging.basicConfig(
     level=logging.INFO,  # Change to DEBUG for more verbose output during troubleshooting
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
+    handlers=[_queue_handler]
 )
+_log_listener = QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 logger = logging.getLogger(__name__)
 
 ###############################################################################
@@ -61,6 +82,10 @@ EBAY_USERTOKEN = os.getenv('EBAY_USERTOKEN')
 EXCHANGERATE_API_KEY = os.getenv('EXCHANGERATE_API_KEY')
 IPAGEO_GEOLOCATION_API_KEY = os.getenv('IPAGEO_GEOLOCATION_API_KEY')
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(',')
+WAITRESS_THREADS = int(os.getenv("WAITRESS_THREADS", "16"))  # Concurrent requests per process
+USE_DEV_SERVER = os.getenv("USE_DEV_SERVER", "false").lower() == "true"  # Werkzeug server for local debugging
+ANALYSIS_TIMEOUT = float(os.getenv("ANALYSIS_TIMEOUT", "30"))  # Seconds before /analyze-image gives up
+WARM_VISION_CLIENT = os.getenv("WARM_VISION_CLIENT", "false").lower() == "true"  # Build the Vision client at startup
 
 # Handle GOOGLE_APPLICATION_CREDENTIALS from the secret
 service_account_json = os.getenv("SERVICE_ACCOUNT_JSON")
@@ -94,8 +119,9 @@ class Config:
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)  # Extended to 1 hour
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)  # Refresh tokens valid for 30 days
     MONGO_URI = MONGO_URI
-    UPLOAD_FOLDER = "uploads"
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5 MB
+    COMPRESS_MIMETYPES = ["application/json"]  # Product lists compress 5-10x
+    COMPRESS_LEVEL = 5
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -121,22 +147,116 @@ app.config.from_object(app_config)
 CORS(app, resources={r"/*": {"origins": app_config.CORS_ORIGINS}})
 logger.info(f"Allowed CORS Origins: {app_config.CORS_ORIGINS}")
 
+# Compress JSON responses for clients that accept gzip/br
+Compress(app)
+
 # Initialize Flask-RESTful API
 api = Api(app)
 
+def _orjson_default(obj):
+    # Only the non-native BSON types PyMongo can hand back in a response
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    """
+    Serializes resource responses with orjson instead of the stdlib json module.
+    """
+    # Naive datetimes in this app are UTC (datetime.utcnow)
+    resp = make_response(orjson.dumps(data, default=_orjson_default, option=orjson.OPT_NAIVE_UTC), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+class OrjsonProvider(JSONProvider):
+    """
+    Backs flask.json (jsonify, request.get_json, JWT error responses) with orjson.
+    """
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NAIVE_UTC).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
 ###############################################################################
 # MONGO + JWT SETUP
 ###############################################################################
 
 # Initialize MongoDB client
 try:
-    client = MongoClient(app.config["MONGO_URI"])
+    # Pool sized for the Waitress threads; fail fast instead of queueing forever
+    client = MongoClient(
+        app.config["MONGO_URI"],
+        maxPoolSize=50,
+        minPoolSize=5,
+        waitQueueTimeoutMS=2000,
+        serverSelectionTimeoutMS=3000,
+        retryWrites=True,
+        compressors="zstd",
+    )
     db = client["visual_search_engine"]
     logger.info("Connected to MongoDB successfully.")
 except Exception as e:
     logger.error(f"Failed to connect to MongoDB: {e}")
     raise
 
+def ensure_index(collection: str, keys, **kwargs) -> bool:
+    """
+    Creates the index if it is missing (idempotent); returns False if it could not be built.
+    A failure only affects this index, so the remaining ones are still attempted.
+    """
+    try:
+        db[collection].create_index(keys, **kwargs)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to create index {keys} on '{collection}': {e}")
+        return False
+
+# Cache entries carry their own expiry time
+ensure_index("vision_cache", "expiresAt", expireAfterSeconds=0)
+ensure_index("search_cache", "expiresAt", expireAfterSeconds=0)
+ensure_index("analysis_cache", "expiresAt", expireAfterSeconds=0)
+# Login looks users up by email; uniqueness also closes the register race. If it
+# can't be built (existing duplicates), Register checks for the user before inserting.
+USERS_EMAIL_UNIQUE = ensure_index("users", "email", unique=True)
+# One entry per item per user; also serves lookups by userId. Without it the
+# wishlist POST checks for the item before inserting.
+WISHLIST_ITEM_UNIQUE = ensure_index("wishlist", [("userId", 1), ("itemId", 1)], unique=True)
+# Stable ordering for paginated wishlist reads
+ensure_index("wishlist", [("userId", 1), ("_id", -1)])
+
+# Wishlist URLs are checked on the stored 'urlsValid' flag when it is set, and
+# with the original regex filter otherwise
+_WISHLIST_URL_REGEX_FILTER = {
+    "imageUrl": {"$regex": "^https?://"},
+    "sourceLink": {"$regex": "^https?://"},
+}
+
+# One-time backfill: flag items stored before 'urlsValid' existed. A marker
+# document records completion so later starts skip the collection scan.
+WISHLIST_URLS_BACKFILLED = False
+try:
+    if db["migrations"].find_one({"_id": "wishlist_urls_valid"}):
+        WISHLIST_URLS_BACKFILLED = True
+    else:
+        db["wishlist"].update_many(
+            {"urlsValid": {"$exists": False}, **_WISHLIST_URL_REGEX_FILTER},
+            {"$set": {"urlsValid": True}},
+        )
+        try:
+            db["migrations"].insert_one({"_id": "wishlist_urls_valid", "appliedAt": datetime.utcnow()})
+        except DuplicateKeyError:
+            pass  # Another process finished the same backfill first
+        WISHLIST_URLS_BACKFILLED = True
+        logger.info("Backfilled 'urlsValid' on existing wishlist items.")
+except Exception as e:
+    logger.error(f"Failed to backfill wishlist 'urlsValid'; falling back to URL regex filtering: {e}")
+
 # Initialize JWT Manager
 try:
     jwt = JWTManager(app)
@@ -145,98 +265,215 @@ except Exception as e:
     logger.error(f"Failed to initialize JWT Manager: {e}")
     raise
 
-# Ensure upload folder exists
-try:
-    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
-    logger.info(f"Upload folder '{app.config['UPLOAD_FOLDER']}' is ready.")
-except Exception as e:
-    logger.error(f"Failed to create upload folder '{app.config['UPLOAD_FOLDER']}': {e}")
-    raise
+###############################################################################
+# ASYNC RUNTIME + SHARED HTTP SESSION
+###############################################################################
+
+# One long-lived event loop serves every request, so the aiohttp connection
+# pool (and its keep-alive connections) survives from one request to the next.
+_event_loop = asyncio.new_event_loop()
+
+# Blocking work (Vision, the eBay SDK, Mongo cache reads/writes) reaches the loop's
+# default executor through asyncio.to_thread. Size it so every Waitress thread can
+# have its concurrent blocking calls in flight at once (peak ~5 per analysis:
+# 3 GCS cache lookups, eBay, Bing's cache); otherwise fast cache lookups queue
+# behind slow Vision/eBay calls and eat into ANALYSIS_TIMEOUT.
+BLOCKING_CALLS_PER_REQUEST = 6
+_event_loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+    max_workers=WAITRESS_THREADS * BLOCKING_CALLS_PER_REQUEST, thread_name_prefix="asyncio-io"
+))
+threading.Thread(target=_event_loop.run_forever, name="asyncio-loop", daemon=True).start()
+
+def run_async(coro, timeout: float = None):
+    """
+    Runs a coroutine on the shared event loop and blocks until it completes.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _event_loop)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        # Don't leave the abandoned coroutine running on the loop
+        future.cancel()
+        raise
+
+async def _create_http_session() -> aiohttp.ClientSession:
+    # The session must be created from inside the loop it will be used on
+    return aiohttp.ClientSession(
+        json_serialize=lambda obj: orjson.dumps(obj).decode(),
+        connector=aiohttp.TCPConnector(
+            limit=100, limit_per_host=20, ttl_dns_cache=300, keepalive_timeout=30
+        )
+    )
+
+APP_HTTP_SESSION = run_async(_create_http_session())
+app.aiohttp_session = APP_HTTP_SESSION
+logger.info("Shared aiohttp session created.")
+
+@atexit.register
+def _close_http_session():
+    run_async(APP_HTTP_SESSION.close())
 
 ###############################################################################
 # REAL GOOGLE VISION DETECTION
 ###############################################################################
 
-def analyze_image_with_vision(image_path: str) -> Dict:
+def _vision():
     """
-    Uses Google Cloud Vision to detect labels, objects, and web entities.
+    Imports the Vision library on first use; it pulls in gRPC and protobuf,
+    which workers that never analyze an image should not have to load.
+    """
+    import google.cloud.vision as vision
+    return vision
+
+# Shared Vision client; building one per request re-creates the gRPC channel,
+# reloads credentials and repeats the TLS handshake.
+_VISION_CLIENT = None
+_VISION_CLIENT_LOCK = threading.Lock()
+
+def get_vision_client():
     """
-    client = vision.ImageAnnotatorClient()
+    Returns the process-wide Vision client, creating it on first use.
+    """
+    global _VISION_CLIENT
+    if _VISION_CLIENT is None:
+        with _VISION_CLIENT_LOCK:
+            if _VISION_CLIENT is None:
+                _VISION_CLIENT = _vision().ImageAnnotatorClient()
+                logger.info("Google Vision client initialized.")
+    return _VISION_CLIENT
+
+def _warm_vision_client():
+    try:
+        get_vision_client()
+    except Exception as e:
+        logger.error(f"Failed to initialize Google Vision client: {e}")
+
+# Build the client in the background at startup so the first analysis doesn't pay
+# for it. Off by default for local runs; the Docker image turns it on.
+if WARM_VISION_CLIENT:
+    threading.Thread(target=_warm_vision_client, name="vision-warmup", daemon=True).start()
+
+# Terms with a word ending in one of these (or its plural) are treated as product
+# categories: "smartwatch" and "t-shirts" match, "watchful" and "dresser" don't
+_CATEGORY_KEYWORDS = ('shirt', 'shoe', 'dress', 'watch', 'phone')
+_CATEGORY_RE = re.compile(r"(?:%s)(?:e?s)?\b" % "|".join(_CATEGORY_KEYWORDS))
 
-    with open(image_path, "rb") as f:
-        content = f.read()
-        image = vision.Image(content=content)
+# Vision results are deterministic for the same bytes, so they are cached by content hash
+VISION_CACHE_TTL = timedelta(days=30)
+
+def image_content_hash(content: bytes) -> str:
+    """
+    Returns a stable hex digest identifying the image bytes.
+    """
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+def analyze_image_with_vision(content: bytes, cache_key: str = None) -> Dict:
+    """
+    Uses Google Cloud Vision to detect labels, objects, and web entities.
+    Pass cache_key when the caller has already hashed the content.
+    """
+    cache_key = cache_key or image_content_hash(content)
+    try:
+        cached = db["vision_cache"].find_one(
+            {"_id": cache_key, "expiresAt": {"$gt": datetime.utcnow()}}, {"result": 1}
+        )
+        if cached:
+            logger.info(f"[VISION] Cache hit for image {cache_key}")
+            return cached["result"]
+    except Exception as e:
+        logger.error(f"[VISION] Cache lookup failed: {e}")
 
-    # 1) Label detection
-    label_response = client.label_detection(image=image)
-    label_detection = label_response.label_annotations
+    result = _run_vision_analysis(content)
 
-    # 2) Object detection
-    obj_response = client.object_localization(image=image)
-    object_detection = obj_response.localized_object_annotations
+    try:
+        db["vision_cache"].update_one(
+            {"_id": cache_key},
+            {"$set": {"result": result, "expiresAt": datetime.utcnow() + VISION_CACHE_TTL}},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.error(f"[VISION] Failed to cache analysis: {e}")
 
-    # 3) Web detection
-    web_response = client.web_detection(image=image)
-    web_detection = web_response.web_detection
+    return result
 
-    detected_terms = []
-    confidence_scores = []
+def _run_vision_analysis(content: bytes) -> Dict:
+    """
+    Calls Google Cloud Vision on the image bytes and builds the analysis result.
+    """
+    vision = _vision()
+    vision_client = get_vision_client()
+    image = vision.Image(content=content)
+
+    # Label, object and web detection in a single round-trip
+    response = vision_client.annotate_image(vision.AnnotateImageRequest(
+        image=image,
+        features=[
+            vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION, max_results=5),
+            vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION, max_results=10),
+            vision.Feature(type_=vision.Feature.Type.WEB_DETECTION, max_results=5),
+        ],
+    ))
+    if response.error.message:
+        raise RuntimeError(f"Vision API error: {response.error.message}")
+
+    label_detection = response.label_annotations
+    object_detection = response.localized_object_annotations
+    web_detection = response.web_detection
+
+    # Detected terms keyed case-insensitively: first casing seen, highest confidence.
+    # Insertion order follows source priority, which decides the search queries.
+    detected = {}
+
+    def add_term(term, score):
+        key = term.lower()
+        seen = detected.get(key)
+        if seen is None:
+            detected[key] = (term, score)
+        elif score > seen[1]:
+            detected[key] = (seen[0], score)
 
     # Best guess labels from web detection
     if web_detection.best_guess_labels:
         for label in web_detection.best_guess_labels:
-            detected_terms.append(label.label)
             # Assume a high confidence for best guess
-            confidence_scores.append(0.9)
+            add_term(label.label, 0.9)
 
     # Web entities with high score
     if web_detection.web_entities:
         # Pick top 2-3, for example
-        sorted_web_entities = sorted(
-            web_detection.web_entities, 
-            key=lambda e: e.score or 0, 
-            reverse=True
+        top_web_entities = heapq.nlargest(
+            2, web_detection.web_entities, key=lambda e: e.score or 0
         )
-        for entity in sorted_web_entities[:2]:
+        for entity in top_web_entities:
             if entity.score and entity.score > 0.7:
-                detected_terms.append(entity.description)
-                confidence_scores.append(entity.score)
+                add_term(entity.description, entity.score)
 
     # Object detection
     for obj in object_detection:
         if obj.score > 0.7:
-            detected_terms.append(obj.name)
-            confidence_scores.append(obj.score)
+            add_term(obj.name, obj.score)
 
     # Label detection
     if label_detection:
-        sorted_labels = sorted(label_detection, key=lambda l: l.score, reverse=True)
-        for lab in sorted_labels[:2]:
+        top_labels = heapq.nlargest(2, label_detection, key=lambda l: l.score)
+        for lab in top_labels:
             if lab.score > 0.8:
-                detected_terms.append(lab.description)
-                confidence_scores.append(lab.score)
-
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_terms = []
-    unique_scores = []
-    for term, sc in zip(detected_terms, confidence_scores):
-        t_lower = term.lower()
-        if t_lower not in seen:
-            seen.add(t_lower)
-            unique_terms.append(term)
-            unique_scores.append(sc)
-
-    avg_conf = sum(unique_scores) / len(unique_scores) if unique_scores else 0
+                add_term(lab.description, lab.score)
+
+    unique_terms = [term for term, _ in detected.values()]
+    avg_conf = sum(score for _, score in detected.values()) / len(detected) if detected else 0
 
     # Example logic: categorize terms
+    category, attributes = [], []
+    for t in unique_terms:
+        (category if _CATEGORY_RE.search(t.lower()) else attributes).append(t)
     product_info = {
-        'category': [t for t in unique_terms if any(cat in t.lower() for cat in ['shirt','shoe','dress','watch','phone'])],
-        'attributes': [t for t in unique_terms if not any(cat in t.lower() for cat in ['shirt','shoe','dress','watch','phone'])],
+        'category': category,
+        'attributes': attributes,
         'confidence': avg_conf > 0.8
     }
 
-    logger.debug(f"Product Info: {product_info}")
+    logger.debug("Product Info: %s", product_info)
 
     return {
         'search_terms': unique_terms[:5],
@@ -244,111 +481,179 @@ def analyze_image_with_vision(image_path: str) -> Dict:
         'confidence': avg_conf > 0.8,
     }
 
+###############################################################################
+# SEARCH RESULT CACHE
+###############################################################################
+
+# Paid, rate-limited lookups repeat across users for the same terms
+SEARCH_CACHE_TTL = timedelta(days=1)
+
+async def get_cached_search(key: str):
+    """
+    Returns the cached products for the key, or None on a miss.
+    """
+    try:
+        doc = await asyncio.to_thread(
+            db["search_cache"].find_one,
+            {"_id": key, "expiresAt": {"$gt": datetime.utcnow()}},
+            {"products": 1},
+        )
+    except Exception as e:
+        logger.error(f"[CACHE] Lookup failed for '{key}': {e}")
+        return None
+    return doc["products"] if doc else None
+
+async def set_cached_search(key: str, products: List[Dict], ttl: timedelta = SEARCH_CACHE_TTL) -> None:
+    """
+    Stores the products for the key until the ttl elapses.
+    """
+    try:
+        await asyncio.to_thread(
+            db["search_cache"].update_one,
+            {"_id": key},
+            {"$set": {"products": products, "expiresAt": datetime.utcnow() + ttl}},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.error(f"[CACHE] Failed to store '{key}': {e}")
+
+async def cached_search(key: str, ttl: timedelta, fetch) -> List[Dict]:
+    """
+    Returns the cached products for the key, or awaits fetch() and caches its result.
+    fetch() returns None for failed lookups, which are not cached.
+    """
+    cached = await get_cached_search(key)
+    if cached is not None:
+        logger.debug("[CACHE] Hit for '%s'", key)
+        return cached
+    products = await fetch()
+    if products is None:
+        return []
+    await set_cached_search(key, products, ttl)
+    return products
+
 ###############################################################################
 # REAL BING VISUAL SEARCH
 ###############################################################################
 
-async def fetch_bing_similar_products(image_path: str, api_key: str) -> List[Dict]:
+async def fetch_bing_similar_products(image_data: bytes, api_key: str, session: aiohttp.ClientSession) -> List[Dict]:
     """
     Uses Bing Visual Search to find similar products.
     """
+    cache_key = f"bing:v2:{image_content_hash(image_data)}"  # v2: hashed product ids
+    return await cached_search(
+        cache_key, SEARCH_CACHE_TTL, lambda: _request_bing(image_data, api_key, session)
+    )
+
+async def _request_bing(image_data: bytes, api_key: str, session: aiohttp.ClientSession) -> Optional[List[Dict]]:
+    """
+    Queries Bing Visual Search, returning None if the request fails.
+    """
     endpoint = "https://api.bing.microsoft.com/v7.0/images/visualsearch"
     headers = {"Ocp-Apim-Subscription-Key": api_key}
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            with open(image_path, "rb") as f:
-                image_data = f.read()
-
-            form = aiohttp.FormData()
-            form.add_field('image', image_data, filename='image.jpg')
-
-            async with session.post(endpoint, headers=headers, data=form) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    logger.debug(f"[BING] Response Data: {data}")
-                    # Parse Bing's response
-                    products = []
-                    tags = data.get('tags', [])
-                    for tag in tags:
-                        actions = tag.get('actions', [])
-                        for act in actions:
-                            if act.get('actionType') == 'ProductVisualSearch':
-                                for item in act.get('data', {}).get('items', []):
-                                    host_page_url = item.get('hostPageUrl', '')
-                                    source_link = host_page_url if host_page_url.startswith(('http://', 'https://')) else f"https://{host_page_url}"
-                                    price = float(item.get('price', 0)) if item.get('price') else 0  # Extract price if available
-                                    products.append({
-                                        'title': item.get('name', ''),
-                                        'price': price,
-                                        'currency': 'USD', 
-                                        'platform': 'Bing Visual Search',
-                                        'imageUrl': item.get('thumbnailUrl', ''),
-                                        'sourceLink': source_link,  
-                                        'id': host_page_url, 
-                                    })
-                    logger.debug(f"[BING] Parsed Products: {products}")
-                    return products
-                else:
-                    logger.error(f"[BING] HTTP {response.status}")
-                    return []
-        except Exception as e:
-            logger.error(f"[BING] Error: {str(e)}")
-            return []
+    try:
+        form = aiohttp.FormData()
+        form.add_field('image', image_data, filename='image.jpg')
+
+        async with session.post(endpoint, headers=headers, data=form) as response:
+            if response.status == 200:
+                data = orjson.loads(await response.read())
+                logger.debug("[BING] Response Data: %s", data)
+                # Parse Bing's response
+                products = []
+                tags = data.get('tags', [])
+                for tag in tags:
+                    actions = tag.get('actions', [])
+                    for act in actions:
+                        if act.get('actionType') == 'ProductVisualSearch':
+                            for item in act.get('data', {}).get('items', []):
+                                host_page_url = item.get('hostPageUrl', '')
+                                source_link = host_page_url if host_page_url.startswith(HTTP_PREFIXES) else f"https://{host_page_url}"
+                                # Extract price if available; one bad value shouldn't drop the whole response
+                                raw_price = item.get('price')
+                                try:
+                                    price = float(raw_price) if raw_price else 0
+                                except (ValueError, TypeError):
+                                    price = 0
+                                # One page can list several products (and hostPageUrl can be missing),
+                                # so the id covers the page, the name and the thumbnail
+                                identity = "\n".join((host_page_url, item.get('name', ''), item.get('thumbnailUrl', '')))
+                                unique_id = f"bing_{hashlib.blake2b(identity.encode(), digest_size=8).hexdigest()}"
+                                products.append({
+                                    'title': item.get('name', ''),
+                                    'price': price,
+                                    'currency': 'USD', 
+                                    'platform': 'Bing Visual Search',
+                                    'imageUrl': item.get('thumbnailUrl', ''),
+                                    'sourceLink': source_link,  
+                                    'id': unique_id, 
+                                })
+                logger.debug("[BING] Parsed Products: %s", products)
+                return products
+            else:
+                logger.error(f"[BING] HTTP {response.status}")
+                return None
+    except Exception as e:
+        logger.error(f"[BING] Error: {str(e)}")
+        return None
 
 ###############################################################################
 # REAL GOOGLE CUSTOM SEARCH
 ###############################################################################
 
+# One alternation over all supported currency markers (symbol or code), so each
+# snippet is scanned once. The amount must end in a digit and is taken whole: a
+# match may not stop where another digit follows (directly or after ',' or '.'),
+# so there is no backtracking into a shorter number, while sentence punctuation
+# after it ('$129.99.', '₹1,299...') is fine. Amounts followed by the words
+# 'off' or 'discount' are skipped ('offer' is fine).
+_PRICE_RE = re.compile(
+    r'(?:₹|€|£|¥|\$|\b(?:INR|EUR|GBP|JPY|USD))\s?([\d,]*\d(?:\.\d+)?)(?![\d,.]?\d)(?!\s?(?:off|discount)\b)',
+    re.IGNORECASE,
+)
+
 def extract_price(text: str) -> float:
     """
     Extracts the most plausible price from the given text.
     Prioritizes higher prices and excludes discount amounts.
     """
-    # Define regex patterns to match prices not followed by 'off' or 'discount'
-    price_patterns = [
-        r'₹\s?([\d,]+\.?\d*)\s?(?!off|discount)',          # Indian Rupee
-        r'\bINR\s?([\d,]+\.?\d*)\b(?!\s?off|discount)',    # INR with word boundary
-        r'€\s?([\d,]+\.?\d*)',                            # Euro
-        r'\bEUR\s?([\d,]+\.?\d*)\b',                      # EUR with word boundary
-        r'£\s?([\d,]+\.?\d*)',                            # British Pound
-        r'\bGBP\s?([\d,]+\.?\d*)\b',                      # GBP with word boundary
-        r'¥\s?([\d,]+\.?\d*)',                            # Japanese Yen
-        r'\bJPY\s?([\d,]+\.?\d*)\b',                      # JPY with word boundary
-        r'\$\s?([\d,]+\.?\d*)',                           # USD symbol
-        r'\bUSD\s?([\d,]+\.?\d*)\b',                      # USD with word boundary
-        # Add more patterns as needed
-    ]
-
     prices = []
-    for pattern in price_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        for match in matches:
-            price_str = match.replace(',', '')
-            try:
-                price = float(price_str)
-                # Implement a sanity check (e.g., prices between 100 and 1,000,000)
-                if 100.0 <= price <= 1000000.0:
-                    prices.append(price)
-                else:
-                    logger.debug(f"Excluded unrealistic price: {price}")
-            except ValueError:
-                logger.debug(f"Failed to convert price string to float: '{match}'")
-                continue
+    for match in _PRICE_RE.findall(text):
+        price_str = match.replace(',', '')
+        try:
+            price = float(price_str)
+            # Implement a sanity check (e.g., prices between 100 and 1,000,000)
+            if 100.0 <= price <= 1000000.0:
+                prices.append(price)
+            else:
+                logger.debug("Excluded unrealistic price: %s", price)
+        except ValueError:
+            logger.debug("Failed to convert price string to float: '%s'", match)
+            continue
 
     if prices:
         # Return the highest plausible price to avoid discounts
         selected_price = max(prices)
-        logger.debug(f"Selected price: {selected_price}")
+        logger.debug("Selected price: %s", selected_price)
         return selected_price
 
     logger.debug("No valid price found in text.")
     return 0.0  # Default if no price found
 
-async def fetch_google_custom_search(search_term: str, api_key: str, cx: str) -> List[Dict]:
+async def fetch_google_custom_search(search_term: str, api_key: str, cx: str, session: aiohttp.ClientSession) -> List[Dict]:
     """
     Fetches search results from Google Custom Search API and extracts product information.
     """
+    cache_key = f"gcs:{cx}:{search_term.lower()}"
+    return await cached_search(
+        cache_key, SEARCH_CACHE_TTL, lambda: _request_google_custom_search(search_term, api_key, cx, session)
+    )
+
+async def _request_google_custom_search(search_term: str, api_key: str, cx: str, session: aiohttp.ClientSession) -> Optional[List[Dict]]:
+    """
+    Queries Google Custom Search, returning None if the request fails.
+    """
     endpoint = "https://www.googleapis.com/customsearch/v1"
     params = {
         'q': search_term,
@@ -358,92 +663,118 @@ async def fetch_google_custom_search(search_term: str, api_key: str, cx: str) ->
         'num': 10,
     }
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(endpoint, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    items = data.get('items', [])
-                    products = []
-                    for it in items:
-                        title = it.get('title', '')
-                        image_url = it.get('link', '')  # main image
-                        snippet = it.get('snippet', '')
-                        pagemap = it.get('pagemap', {})
-                        source_link = it.get('image', {}).get('contextLink', '')
-
-                        logger.debug(f"[GCS] Processing item: {title}")
-                        logger.debug(f"[GCS] Pagemap: {pagemap}")
-
-                        if not source_link.startswith(('http://', 'https://')):
-                            logger.warning(f"Invalid sourceLink for GCS item: '{title}'. Skipping.")
-                            continue
-
-                        price = 0.0
-
-                        # Attempt price from pagemap.offer
-                        if 'offer' in pagemap and isinstance(pagemap['offer'], list) and len(pagemap['offer']) > 0:
-                            offer = pagemap['offer'][0]
-                            if 'price' in offer:
-                                try:
-                                    price = float(offer['price'])
-                                    logger.debug(f"[GCS] Extracted price from offer: {price}")
-                                except (ValueError, TypeError):
-                                    price = 0.0
-                                    logger.error(f"[GCS] Failed to convert offer price for item '{title}'")
-
-                        # Attempt price from pagemap.product
-                        if price == 0.0 and 'product' in pagemap and isinstance(pagemap['product'], list) and len(pagemap['product']) > 0:
-                            product = pagemap['product'][0]
-                            if 'price' in product:
-                                try:
-                                    price = float(product['price'])
-                                    logger.debug(f"[GCS] Extracted price from product: {price}")
-                                except (ValueError, TypeError):
-                                    price = 0.0
-                                    logger.error(f"[GCS] Failed to convert product price for item '{title}'")
-
-                        # If price still not found, try snippet
-                        if price == 0.0:
-                            price = extract_price(snippet)
-                            logger.debug(f"[GCS] Extracted price from snippet: {price}")
-
-                        # Force image URL check
-                        if not image_url.startswith(('http://', 'https://')):
-                            logger.warning(f"Invalid imageUrl for GCS item: '{title}'. Skipping.")
-                            continue
-
-                        # Hardcode currency to 'INR'
-                        product_currency = 'INR'
-
-                        # Create a unique ID
-                        unique_id = f"gcs_{hash(source_link)}"
-
-                        # Add product to the list
-                        products.append({
-                            'id': unique_id,
-                            'title': title,
-                            'price': price,
-                            'currency': product_currency,  # Include currency
-                            'platform': 'Google Custom Search',
-                            'imageUrl': image_url,
-                            'sourceLink': source_link,  # Ensure protocol
-                        })
-                        logger.debug(f"[GCS] Added product: {unique_id}, Price: {price} {product_currency}")
-
-                    logger.debug(f"[GCS] Total parsed products: {len(products)}")
-                    return products
-                else:
-                    logger.error(f"[GCS] HTTP {response.status} for search term '{search_term}'")
-                    return []
-        except Exception as ex:
-            logger.error(f"[GCS] Error during search: {str(ex)}")
-            return []
+    try:
+        async with session.get(endpoint, params=params) as response:
+            if response.status == 200:
+                data = orjson.loads(await response.read())
+                items = data.get('items', [])
+                products = []
+                for it in items:
+                    title = it.get('title', '')
+                    image_url = it.get('link', '')  # main image
+                    snippet = it.get('snippet', '')
+                    pagemap = it.get('pagemap', {})
+                    source_link = it.get('image', {}).get('contextLink', '')
+
+                    logger.debug("[GCS] Processing item: %s", title)
+                    logger.debug("[GCS] Pagemap: %s", pagemap)
+
+                    if not source_link.startswith(HTTP_PREFIXES):
+                        logger.warning(f"Invalid sourceLink for GCS item: '{title}'. Skipping.")
+                        continue
+
+                    price = 0.0
+
+                    # Attempt price from pagemap.offer
+                    if 'offer' in pagemap and isinstance(pagemap['offer'], list) and len(pagemap['offer']) > 0:
+                        offer = pagemap['offer'][0]
+                        if 'price' in offer:
+                            try:
+                                price = float(offer['price'])
+                                logger.debug("[GCS] Extracted price from offer: %s", price)
+                            except (ValueError, TypeError):
+                                price = 0.0
+                                logger.error(f"[GCS] Failed to convert offer price for item '{title}'")
+
+                    # Attempt price from pagemap.product
+                    if price == 0.0 and 'product' in pagemap and isinstance(pagemap['product'], list) and len(pagemap['product']) > 0:
+                        product = pagemap['product'][0]
+                        if 'price' in product:
+                            try:
+                                price = float(product['price'])
+                                logger.debug("[GCS] Extracted price from product: %s", price)
+                            except (ValueError, TypeError):
+                                price = 0.0
+                                logger.error(f"[GCS] Failed to convert product price for item '{title}'")
+
+                    # If price still not found, try snippet
+                    if price == 0.0:
+                        price = extract_price(snippet)
+                        logger.debug("[GCS] Extracted price from snippet: %s", price)
+
+                    # Force image URL check
+                    if not image_url.startswith(HTTP_PREFIXES):
+                        logger.warning(f"Invalid imageUrl for GCS item: '{title}'. Skipping.")
+                        continue
+
+                    # Hardcode currency to 'INR'
+                    product_currency = 'INR'
+
+                    # Create a unique ID (stable across processes, unlike hash())
+                    unique_id = f"gcs_{hashlib.blake2b(source_link.encode(), digest_size=8).hexdigest()}"
+
+                    # Add product to the list
+                    products.append({
+                        'id': unique_id,
+                        'title': title,
+                        'price': price,
+                        'currency': product_currency,  # Include currency
+                        'platform': 'Google Custom Search',
+                        'imageUrl': image_url,
+                        'sourceLink': source_link,  # Ensure protocol
+                    })
+                    logger.debug("[GCS] Added product: %s, Price: %s %s", unique_id, price, product_currency)
+
+                logger.debug("[GCS] Total parsed products: %s", len(products))
+                return products
+            else:
+                logger.error(f"[GCS] HTTP {response.status} for search term '{search_term}'")
+                return None
+    except Exception as ex:
+        logger.error(f"[GCS] Error during search: {str(ex)}")
+        return None
 
 ###############################################################################
 # AUTH RESOURCES
 ###############################################################################
 
+# Cost 10 hashes in roughly a quarter of the time of bcrypt's default 12; override to match the hardware
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "10"))
+
+# Bcrypt is deliberately CPU-heavy, so cap how many hashes run at once. This
+# limits CPU contention only: the calling Waitress thread still blocks on the result.
+_BCRYPT_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="bcrypt")
+
+# Password hashes by email for repeat logins; only found users are cached, so a
+# fresh registration is never shadowed by a stale miss
+_USER_CACHE = TTLCache(maxsize=1024, ttl=60)
+_USER_CACHE_LOCK = threading.Lock()
+
+def find_user_password(email: str) -> Optional[str]:
+    """
+    Returns the stored password hash for the email, or None if there is no such user.
+    """
+    with _USER_CACHE_LOCK:
+        hashed = _USER_CACHE.get(email)
+    if hashed is not None:
+        return hashed
+    user = db["users"].find_one({"email": email}, {"password": 1})
+    if not user:
+        return None
+    with _USER_CACHE_LOCK:
+        _USER_CACHE[email] = user["password"]
+    return user["password"]
+
 class Register(Resource):
     def post(self):
         data = request.get_json()
@@ -451,12 +782,12 @@ class Register(Resource):
             logger.error("Registration failed: Email and password are required")
             return {"error": "Email and password are required"}, 400
 
-        hashed_password = bcrypt.hashpw(
-            data["password"].encode("utf-8"), bcrypt.gensalt()
-        )
+        hashed_password = _BCRYPT_POOL.submit(
+            bcrypt.hashpw, data["password"].encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+        ).result()
         user = {"email": data["email"], "password": hashed_password.decode("utf-8")}
 
-        if db["users"].find_one({"email": user["email"]}):
+        if not USERS_EMAIL_UNIQUE and db["users"].find_one({"email": user["email"]}, {"_id": 1}):
             logger.error(f"Registration failed: User already exists ({user['email']})")
             return {"error": "User already exists"}, 400
 
@@ -464,6 +795,9 @@ class Register(Resource):
             db["users"].insert_one(user)
             logger.info(f"User registered successfully: {user['email']}")
             return {"message": "User registered successfully"}, 201
+        except DuplicateKeyError:
+            logger.error(f"Registration failed: User already exists ({user['email']})")
+            return {"error": "User already exists"}, 400
         except Exception as e:
             logger.error(f"Error registering user {user['email']}: {str(e)}")
             return {"error": "Failed to register user"}, 500
@@ -475,28 +809,29 @@ class Login(Resource):
             logger.error("Login failed: Email and password are required")
             return {"error": "Email and password are required"}, 400
 
-        user = db["users"].find_one({"email": data["email"]})
-        if not user:
+        email = data["email"]
+        hashed_password = find_user_password(email)
+        if not hashed_password:
             logger.warning(f"Login failed: Invalid email ({data.get('email')})")
             return {"error": "Invalid email or password"}, 401
 
         # Compare hashed password
-        if not bcrypt.checkpw(
-            data["password"].encode("utf-8"), user["password"].encode("utf-8")
-        ):
+        if not _BCRYPT_POOL.submit(
+            bcrypt.checkpw, data["password"].encode("utf-8"), hashed_password.encode("utf-8")
+        ).result():
             logger.warning(f"Login failed: Incorrect password for email ({data.get('email')})")
             return {"error": "Invalid email or password"}, 401
 
         try:
-            access_token = create_access_token(identity=user["email"])
-            refresh_token = create_refresh_token(identity=user["email"])
-            logger.info(f"User logged in successfully: {user['email']}")
+            access_token = create_access_token(identity=email)
+            refresh_token = create_refresh_token(identity=email)
+            logger.info(f"User logged in successfully: {email}")
             return {
                 "access_token": access_token,
                 "refresh_token": refresh_token
             }, 200
         except Exception as e:
-            logger.error(f"Error generating tokens for user {user['email']}: {str(e)}")
+            logger.error(f"Error generating tokens for user {email}: {str(e)}")
             return {"error": "Failed to generate tokens"}, 500
 
 class RefreshTokenResource(Resource):
@@ -515,26 +850,42 @@ class RefreshTokenResource(Resource):
 # WISHLIST RESOURCE
 ###############################################################################
 
+# Upper bound on items returned by a single wishlist read (also the default page size)
+WISHLIST_MAX_ITEMS = 500
+
 class ProtectedWishlist(Resource):
     @jwt_required()
     def get(self):
         user_email = get_jwt_identity()
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('page_size', WISHLIST_MAX_ITEMS, type=int), 1), WISHLIST_MAX_ITEMS)
         try:
-            wishlist = list(db["wishlist"].find(
-                {
-                    "userId": user_email, 
-                    "imageUrl": {"$ne": None, "$regex": "^(http|https)://"},
-                    "sourceLink": {"$ne": None, "$regex": "^(http|https)://"}
-                }, 
-                {"_id": 0, "userId": 0, "createdAt": 0, "updatedAt": 0}
+            wishlist = list(db["wishlist"].aggregate(
+                [
+                    {"$match": {
+                        "userId": user_email,
+                        **({"urlsValid": True} if WISHLIST_URLS_BACKFILLED else _WISHLIST_URL_REGEX_FILTER),
+                    }},
+                    {"$sort": {"_id": 1}},  # Insertion order
+                    {"$skip": (page - 1) * page_size},
+                    {"$limit": page_size},
+                    # Only the fields of the frontend's Product, with 'itemId' renamed to 'id'
+                    {"$project": {
+                        "_id": 0,
+                        "id": "$itemId",
+                        "title": 1,
+                        "price": 1,
+                        "currency": 1,
+                        "platform": 1,
+                        "imageUrl": 1,
+                        "sourceLink": 1,
+                    }},
+                ],
+                batchSize=100,
             ))
-            
-            # Rename 'itemId' to 'id' for frontend consistency
-            for item in wishlist:
-                item['id'] = item.pop('itemId', None)
-            
+
             logger.info(f"Fetched wishlist for user: {user_email}, count: {len(wishlist)}")
-            return {"wishlist": wishlist, "count": len(wishlist)}, 200
+            return {"wishlist": wishlist, "count": len(wishlist), "page": page, "page_size": page_size}, 200
         except Exception as e:
             logger.error(f"Error fetching wishlist for user {user_email}: {str(e)}")
             return {"error": "Failed to fetch wishlist"}, 500
@@ -557,24 +908,27 @@ class ProtectedWishlist(Resource):
             logger.error(f"Error in POST /wishlist-protected: {error_message}")
             return {"error": error_message}, 400
 
-        if not isinstance(data["imageUrl"], str) or not data["imageUrl"].startswith(('http://', 'https://')):
+        if not isinstance(data["imageUrl"], str) or not data["imageUrl"].startswith(HTTP_PREFIXES):
             error_message = "Field 'imageUrl' must be a valid URL"
             logger.error(f"Error in POST /wishlist-protected: {error_message}")
             return {"error": error_message}, 400
 
-        if not isinstance(data["sourceLink"], str) or not data["sourceLink"].startswith(('http://', 'https://')):
+        if not isinstance(data["sourceLink"], str) or not data["sourceLink"].startswith(HTTP_PREFIXES):
             error_message = "Field 'sourceLink' must be a valid URL"
             logger.error(f"Error in POST /wishlist-protected: {error_message}")
             return {"error": error_message}, 400
 
+        now = datetime.utcnow()  # Stored as a BSON date
         data.update({
             "userId": user_email,
-            "createdAt": datetime.utcnow().isoformat(),
-            "updatedAt": datetime.utcnow().isoformat(),
+            "urlsValid": True,  # Both URLs were validated above
+            "createdAt": now,
+            "updatedAt": now,
         })
 
-        existing_item = db["wishlist"].find_one({"userId": user_email, "itemId": data["itemId"]})
-        if existing_item:
+        if not WISHLIST_ITEM_UNIQUE and db["wishlist"].find_one(
+            {"userId": user_email, "itemId": data["itemId"]}, {"_id": 1}
+        ):
             error_message = "Item already exists in wishlist"
             logger.error(f"Error in POST /wishlist-protected: {error_message}")
             return {"error": error_message}, 400
@@ -582,6 +936,10 @@ class ProtectedWishlist(Resource):
         try:
             db["wishlist"].insert_one(data)
             logger.info(f"Wishlist item added for user {user_email}: {data}")
+        except DuplicateKeyError:
+            error_message = "Item already exists in wishlist"
+            logger.error(f"Error in POST /wishlist-protected: {error_message}")
+            return {"error": error_message}, 400
         except Exception as e:
             logger.error(f"Error adding item to wishlist for user {user_email}: {str(e)}")
             return {"error": "Failed to add item to wishlist"}, 500
@@ -623,10 +981,67 @@ class ProtectedWishlist(Resource):
 # IMAGE ANALYSIS RESOURCE
 ###############################################################################
 
+# Defaults for product fields the frontend requires; 'id' first, as 'sourceLink' falls back to it
+_PRODUCT_DEFAULTS = (
+    ('id', ''),
+    ('title', 'No Title'),
+    ('price', 0),
+    ('platform', 'Unknown'),
+    ('imageUrl', ''),
+)
+_PRODUCT_FIELDS = frozenset(key for key, _ in _PRODUCT_DEFAULTS) | {'sourceLink'}
+
+# Full /analyze-image responses are reused briefly for identical uploads
+ANALYSIS_CACHE_TTL = timedelta(minutes=5)
+
+def get_cached_analysis(cache_key: str):
+    """
+    Returns the cached analysis response for the image hash, or None on a miss.
+    """
+    try:
+        doc = db["analysis_cache"].find_one(
+            {"_id": cache_key, "expiresAt": {"$gt": datetime.utcnow()}}, {"response": 1}
+        )
+    except Exception as e:
+        logger.error(f"[CACHE] Analysis lookup failed for {cache_key}: {e}")
+        return None
+    if doc:
+        logger.info(f"[CACHE] Analysis cache hit for image {cache_key}")
+        return doc["response"]
+    return None
+
+def set_cached_analysis(cache_key: str, response: Dict) -> None:
+    """
+    Stores the analysis response for the image hash until ANALYSIS_CACHE_TTL elapses.
+    """
+    try:
+        db["analysis_cache"].update_one(
+            {"_id": cache_key},
+            {"$set": {"response": response, "expiresAt": datetime.utcnow() + ANALYSIS_CACHE_TTL}},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.error(f"[CACHE] Failed to store analysis for {cache_key}: {e}")
+
+# Number of search terms sent to Google Custom Search per analysis
+GCS_MAX_QUERIES = 3
+# Bing is dropped when Vision is confident and GCS already returned this many products
+BING_SKIP_GCS_RESULTS = 10
+
+# Shared eBay client; credentials are validated once here, and eBay is skipped if they're missing
+try:
+    EBAY_SEARCHER = EbaySearcher()
+except ValueError:
+    EBAY_SEARCHER = None
+
 class ImageAnalysis(Resource):
     @jwt_required()
     def post(self):
         try:
+            # Reject oversized uploads from the header, before the body is parsed
+            if request.content_length and request.content_length > app.config["MAX_CONTENT_LENGTH"]:
+                raise RequestEntityTooLarge()
+
             if "image" not in request.files:
                 logger.error("No image file provided in the request")
                 return {"error": "No image file provided"}, 400
@@ -640,154 +1055,240 @@ class ImageAnalysis(Resource):
                 logger.error(f"File not allowed: {image.filename}")
                 return {"error": "File type not allowed"}, 400
 
-            filename = secure_filename(image.filename)
-            file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            image.save(file_path)
-            logger.info(f"Image saved: {file_path}")
-
-            try:
-                # 1. Analyze with Vision
-                analysis_result = analyze_image_with_vision(file_path)
-                search_terms = analysis_result["search_terms"]
-                product_info = analysis_result["product_info"]
-                logger.info(f"[VISION] Detected search terms: {search_terms}")
-                logger.info(f"[VISION] Product Info: {product_info}")
-
-                all_results = []
-
-                # 2. GOOGLE CUSTOM SEARCH
-                try:
-                    logger.info("[GCS] Fetching Google Custom Search results...")
-                    search_queries = []
-                    if search_terms:
-                        # Prioritize broader terms over specific ones
-                        for term in search_terms:
-                            cleaned_term = clean_search_term(term)
-                            if cleaned_term and cleaned_term not in search_queries:
-                                search_queries.append(cleaned_term)
-                    if product_info["category"]:
-                        for category in product_info["category"]:
-                            cleaned_category = clean_search_term(category)
-                            if cleaned_category and cleaned_category not in search_queries:
-                                search_queries.append(cleaned_category)
-
-                    # Use only the first specific search term to ensure consistency
-                    if search_queries:
-                        primary_search_term = search_queries[0]
-                        google_results = asyncio.run(fetch_google_custom_search(
-                            primary_search_term, GCS_API_KEY, GCS_CX
-                        ))
-                        if google_results:
-                            logger.info(f"[GCS] Found {len(google_results)} results for '{primary_search_term}'.")
-                            all_results.extend(google_results)
-                except Exception as gcs_exc:
-                    logger.error(f"[GCS] Google Custom Search error: {str(gcs_exc)}")
-
-                # 3. EBAY
-                try:
-                    logger.info("[EBAY] Fetching eBay search results...")
-                    ebay_scraper = EbaySearcher()
-                    # Use the same primary search term for eBay
-                    if search_terms:
-                        ebay_search_term = search_terms[0]
-                    elif product_info["category"]:
-                        ebay_search_term = product_info["category"][0]
-                    else:
-                        ebay_search_term = "Shoe"  # Default term
-
-                    # Clean the eBay search term similarly
-                    ebay_search_term_cleaned = clean_search_term(ebay_search_term)
-                    if not ebay_search_term_cleaned:
-                        ebay_search_term_cleaned = "Shoe"  # Fallback
-
-                    # Set default values since geolocation is removed
-                    user_country_code = 'IN'  # India
-                    user_currency = 'INR'
-
-                    ebay_results = asyncio.run(ebay_scraper.search_products(
-                        ebay_search_term_cleaned, user_country_code, user_currency, max_results=10
-                    ))
-                    logger.info(f"[EBAY] Found {len(ebay_results)} results for '{ebay_search_term_cleaned}'.")
-                    all_results.extend(ebay_results)
-                except Exception as ebay_exc:
-                    logger.error(f"[EBAY] eBay Search error: {str(ebay_exc)}")
-
-                # 4. Deduplicate
-                seen = set()
-                unique_results = []
-                for item in all_results:
-                    key = (
-                        item.get("title","").lower(),
-                        item.get("price", ""),
-                        item.get("id",""),
-                        item.get("platform",""),
-                    )
-                    if key not in seen:
-                        seen.add(key)
-                        unique_results.append(item)
-
-                # 5. Score & sort
-                scored_results = []
-                for r in unique_results:
-                    score = 0
-                    title_lower = r["title"].lower() if "title" in r else ""
-                    for st in search_terms:
-                        if st.lower() in title_lower:
-                            score += 5  # Increased weight for specific search terms
-                    for c in product_info["category"]:
-                        if c.lower() in title_lower:
-                            score += 3  # Reduced weight for category terms
-                    for a in product_info["attributes"]:
-                        if a.lower() in title_lower:
-                            score += 1  # Minimal weight for attributes
-                    # If item has a 'condition' of "new" in it
-                    if r.get("condition") and "new" in r["condition"].lower():
-                        score += 0.5
-                    r["relevance_score"] = score
-                    scored_results.append(r)
-
-                final_results = sorted(
-                    scored_results, key=lambda x: x["relevance_score"], reverse=True
-                )
-                logger.info(f"[FINAL] Final unique results count: {len(final_results)}")
-
-                # Optionally, include products with price=0.0 by not filtering them out
-                # If you still want to filter out, uncomment the following lines
-                # final_results = [
-                #     product for product in final_results 
-                #     if product.get('price', 0) > 0
-                # ]
-
-                # Further enhance product data
-                for product in final_results:
-                    # Ensure all required fields are present
-                    product['id'] = product.get('id', '')  # Already set from backend
-                    product['title'] = product.get('title', 'No Title')
-                    product['price'] = product.get('price', 0)
-                    product['platform'] = product.get('platform', 'Unknown')
-                    product['imageUrl'] = product.get('imageUrl', '')
-                    product['sourceLink'] = product.get('sourceLink', product.get('id', ''))  # Fallback to 'id' if 'sourceLink' not available
-
-                # Log final results for debugging
-                logger.debug(f"[FINAL] Final Results: {final_results}")
-
-                return {
-                    "message": "Image analyzed successfully",
-                    "product_info": product_info,
-                    "search_terms": search_terms,
-                    "products": final_results[:20],
-                    "results_count": len(final_results),
-                }, 200
-
-            finally:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"Image file removed: {file_path}")
+            # The analysis works on the upload bytes directly; nothing touches disk
+            image_bytes = image.read()
+
+            # A re-upload of the same image is answered from the short-lived cache
+            cache_key = image_content_hash(image_bytes)
+            cached = get_cached_analysis(cache_key)
+            if cached is not None:
+                return cached, 200
+
+            # Vision and Bing don't need full-resolution photos; the cache key stays on the original bytes
+            image_bytes = downscale_image(image_bytes)
+
+            # Run the whole pipeline on the shared event loop
+            result, providers_ok = run_async(self._analyze(image_bytes, cache_key), timeout=ANALYSIS_TIMEOUT)
+            # Like the search cache, don't pin a failed or empty lookup for the cache TTL
+            if providers_ok and result["products"]:
+                set_cached_analysis(cache_key, result)
+            return result, 200
+
+        except RequestEntityTooLarge:
+            logger.error(f"Upload too large: {request.content_length} bytes")
+            return {"error": "Image file is too large"}, 413
 
+        except concurrent.futures.TimeoutError:
+            logger.error(f"[Analysis Error] Timed out after {ANALYSIS_TIMEOUT}s")
+            return {"error": "Analysis timed out"}, 504
         except Exception as e:
             logger.error(f"[Analysis Error] {str(e)}")
             return {"error": f"Analysis failed: {str(e)}"}, 500
 
+    async def _analyze(self, image_bytes: bytes, image_hash: str) -> Tuple[Dict, bool]:
+        """
+        Analyzes the uploaded image and gathers, ranks and shapes matching products.
+        Returns the response and whether every product search completed without raising.
+        """
+        # Bing only needs the image, not the labels, so start it alongside Vision
+        bing_task = None
+        if BING_SUBSCRIPTION_KEY:
+            bing_task = asyncio.create_task(
+                fetch_bing_similar_products(image_bytes, BING_SUBSCRIPTION_KEY, APP_HTTP_SESSION)
+            )
+        try:
+            return await self._run_pipeline(image_bytes, image_hash, bing_task)
+        finally:
+            # On errors and on cancellation (the run_async timeout) stop any Bing upload
+            # still in flight; a no-op once the task has finished
+            if bing_task is not None:
+                bing_task.cancel()
+
+    async def _run_pipeline(self, image_bytes: bytes, image_hash: str, bing_task: Optional[asyncio.Task]) -> Tuple[Dict, bool]:
+        """
+        Runs Vision, the product searches and the ranking; bing_task is already running (or None).
+        """
+        # 1. Analyze with Vision (blocking gRPC client, so keep it off the event loop)
+        analysis_result = await asyncio.to_thread(analyze_image_with_vision, image_bytes, image_hash)
+        search_terms = analysis_result["search_terms"]
+        product_info = analysis_result["product_info"]
+        logger.info(f"[VISION] Detected search terms: {search_terms}")
+        logger.info(f"[VISION] Product Info: {product_info}")
+
+        all_results = []
+
+        # 2. GOOGLE CUSTOM SEARCH
+        async def search_google() -> List[Dict]:
+            logger.info("[GCS] Fetching Google Custom Search results...")
+            search_queries = []
+            if search_terms:
+                # Prioritize broader terms over specific ones
+                for term in search_terms:
+                    cleaned_term = clean_search_term(term)
+                    if cleaned_term and cleaned_term not in search_queries:
+                        search_queries.append(cleaned_term)
+            if product_info["category"]:
+                for category in product_info["category"]:
+                    cleaned_category = clean_search_term(category)
+                    if cleaned_category and cleaned_category not in search_queries:
+                        search_queries.append(cleaned_category)
+
+            # Query the top few terms concurrently; repeated products are merged by id below
+            top_terms = search_queries[:GCS_MAX_QUERIES]
+            batches = await asyncio.gather(*(
+                fetch_google_custom_search(term, GCS_API_KEY, GCS_CX, APP_HTTP_SESSION)
+                for term in top_terms
+            ))
+            google_results = [product for batch in batches for product in batch]
+            if google_results:
+                logger.info(f"[GCS] Found {len(google_results)} results for {top_terms}.")
+            return google_results
+
+        # 3. EBAY
+        async def search_ebay() -> List[Dict]:
+            if EBAY_SEARCHER is None:
+                return []
+            logger.info("[EBAY] Fetching eBay search results...")
+            # Use the same primary search term for eBay
+            if search_terms:
+                ebay_search_term = search_terms[0]
+            elif product_info["category"]:
+                ebay_search_term = product_info["category"][0]
+            else:
+                ebay_search_term = "Shoe"  # Default term
+
+            # Clean the eBay search term similarly
+            ebay_search_term_cleaned = clean_search_term(ebay_search_term)
+            if not ebay_search_term_cleaned:
+                ebay_search_term_cleaned = "Shoe"  # Fallback
+
+            # Set default values since geolocation is removed
+            user_country_code = 'IN'  # India
+            user_currency = 'INR'
+
+            ebay_results = await EBAY_SEARCHER.search_products(
+                ebay_search_term_cleaned, user_country_code, user_currency, max_results=10
+            )
+            logger.info(f"[EBAY] Found {len(ebay_results)} results for '{ebay_search_term_cleaned}'.")
+            return ebay_results
+
+        google_task = asyncio.create_task(search_google())
+
+        # BING (already in flight since before Vision)
+        async def search_bing() -> List[Dict]:
+            if bing_task is None:
+                return []
+            if analysis_result["confidence"]:
+                # Race Bing against GCS: confident labels plus a full page of GCS hits make
+                # a still-running Bing upload redundant, but a finished Bing result is kept
+                await asyncio.wait({google_task, bing_task}, return_when=asyncio.FIRST_COMPLETED)
+                if not bing_task.done() and google_task.exception() is None:
+                    # The GCS term batches can overlap, so count distinct products
+                    gcs_unique = {(p.get("platform", ""), p.get("id", "")) for p in google_task.result()}
+                    if len(gcs_unique) >= BING_SKIP_GCS_RESULTS:
+                        bing_task.cancel()
+                        logger.info("[BING] Skipped: Vision is confident and GCS returned enough results.")
+                        return []
+            bing_results = await bing_task
+            logger.info(f"[BING] Found {len(bing_results)} visually similar products.")
+            return bing_results
+
+        # All sources are I/O bound, so query them concurrently
+        google_results, ebay_results, bing_results = await asyncio.gather(
+            google_task, search_ebay(), search_bing(), return_exceptions=True
+        )
+        providers_ok = not any(
+            isinstance(results, Exception) for results in (google_results, ebay_results, bing_results)
+        )
+        if isinstance(google_results, Exception):
+            logger.error(f"[GCS] Google Custom Search error: {str(google_results)}")
+        else:
+            all_results.extend(google_results)
+        if isinstance(ebay_results, Exception):
+            logger.error(f"[EBAY] eBay Search error: {str(ebay_results)}")
+        else:
+            all_results.extend(ebay_results)
+        if isinstance(bing_results, Exception):
+            logger.error(f"[BING] Bing Visual Search error: {str(bing_results)}")
+        else:
+            all_results.extend(bing_results)
+
+        # 4. Deduplicate & score in one pass
+        # Weight per lowercased keyword; a keyword in several lists earns each list's weight
+        keyword_weights = {}
+        for keywords, weight in (
+            (search_terms, 5),                 # Increased weight for specific search terms
+            (product_info["category"], 3),     # Reduced weight for category terms
+            (product_info["attributes"], 1),   # Minimal weight for attributes
+        ):
+            for kw in keywords:
+                kw = kw.lower()
+                if kw:
+                    keyword_weights[kw] = keyword_weights.get(kw, 0) + weight
+
+        # One Aho-Corasick pass per title finds every keyword it contains
+        matcher = None
+        if keyword_weights:
+            matcher = ahocorasick.Automaton()
+            for kw, weight in keyword_weights.items():
+                matcher.add_word(kw, (kw, weight))
+            matcher.make_automaton()
+
+        # Ids are unique within each source (eBay item ids, hashed GCS links, hashed
+        # Bing page+name+thumbnail); key on the platform too so sources can't collide
+        unique_results = {}
+        for r in all_results:
+            key = (r.get("platform", ""), r.get("id", ""))
+            if key in unique_results:
+                continue
+            score = 0
+            if matcher is not None and "title" in r:
+                # A keyword counts once however often it occurs in the title
+                matches = dict(match for _, match in matcher.iter(r["title"].lower()))
+                score = sum(matches.values())
+            # If item has a 'condition' of "new" in it
+            if r.get("condition") and "new" in r["condition"].lower():
+                score += 0.5
+            r["relevance_score"] = score
+            unique_results[key] = r
+
+        # 5. Rank
+        # results_count reports every unique match, not just the ones returned
+        total_count = len(unique_results)
+        logger.info(f"[FINAL] Final unique results count: {total_count}")
+
+        # Optionally, include products with price=0.0 by not filtering them out
+        # If you still want to filter out, uncomment the following lines
+        # final_results = [
+        #     product for product in final_results 
+        #     if product.get('price', 0) > 0
+        # ]
+
+        # Only the top 20 are returned, so select them instead of sorting everything
+        final_results = tuple(heapq.nlargest(20, unique_results.values(), key=itemgetter("relevance_score")))
+
+        # Further enhance product data
+        for product in final_results:
+            # The search adapters normally fill every field; skip those products
+            if product.keys() >= _PRODUCT_FIELDS:
+                continue
+            # Ensure all required fields are present
+            for key, default in _PRODUCT_DEFAULTS:
+                product.setdefault(key, default)
+            if 'sourceLink' not in product:
+                product['sourceLink'] = product['id']  # Fallback to 'id' if 'sourceLink' not available
+
+        # Log final results for debugging
+        logger.debug("[FINAL] Final Results: %s", final_results)
+
+        return {
+            "message": "Image analyzed successfully",
+            "product_info": product_info,
+            "search_terms": search_terms,
+            "products": final_results,
+            "results_count": total_count,
+        }, providers_ok
+
 ###############################################################################
 # WELCOME
 ###############################################################################
@@ -822,12 +1323,12 @@ def allowed_file(filename):
 
 if __name__ == "__main__":
     try:
-        if app.config.get('DEBUG', False):
-            logger.info("Starting Flask app in DEBUG mode.")
-            app.run(host='0.0.0.0', port=5000, debug=True)
+        if USE_DEV_SERVER:
+            logger.info("Starting Flask development server.")
+            app.run(host='0.0.0.0', port=5000, debug=app.config.get('DEBUG', False))
         else:
             logger.info("Starting Flask app with Waitress server.")
-            serve(app, host='0.0.0.0', port=5000)
+            serve(app, host='0.0.0.0', port=5000, threads=WAITRESS_THREADS)
     except Exception as e:
         logger.critical(f"Failed to start the application: {str(e)}")
         raise
@@ -1,21 +1,16 @@
 # scrapers.py
 
 import os
-import re
+import asyncio
+import threading
 import logging
 from typing import List, Dict
 from ebaysdk.finding import Connection as Finding
 from ebaysdk.exception import ConnectionError
+from utils import HTTP_PREFIXES
 
 logger = logging.getLogger(__name__)
 
-def clean_price(price_str):
-    cleaned_price = re.sub(r'[^\d.]', '', price_str)
-    try:
-        return float(cleaned_price)
-    except ValueError:
-        return 0.0
-
 class EbaySearcher:
     def __init__(self):
         self.app_id = os.getenv('EBAY_APPID')
@@ -24,11 +19,26 @@ class EbaySearcher:
         if not all([self.app_id, self.devid, self.certid]):
             logger.error("eBay API credentials are not fully set in environment variables.")
             raise ValueError("eBay API credentials are required.")
-        self.api = Finding(appid=self.app_id, devid=self.devid, certid=self.certid, config_file=None)
+        # ebaysdk connections keep per-call request/response state on the object,
+        # so a shared searcher gives each worker thread its own connection
+        self._local = threading.local()
+
+    @property
+    def api(self) -> Finding:
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = self._local.api = Finding(appid=self.app_id, devid=self.devid, certid=self.certid, config_file=None)
+        return api
+
+    def _find_items(self, params: Dict) -> List[Dict]:
+        # Blocking: the HTTP call and the XML-to-dict conversion of the response
+        response = self.api.execute('findItemsAdvanced', params)
+        return response.dict().get('searchResult', {}).get('item', [])
 
     async def search_products(self, search_term: str, country_code: str, currency: str, max_results: int = 10) -> List[Dict]:
         try:
-            response = self.api.execute('findItemsAdvanced', {
+            # ebaysdk is blocking, so keep both the request and the parsing off the event loop
+            items = await asyncio.to_thread(self._find_items, {
                 'keywords': search_term,
                 'paginationInput': {
                     'entriesPerPage': max_results,
@@ -42,29 +52,33 @@ class EbaySearcher:
                     }
                 ]
             })
-            items = response.dict().get('searchResult', {}).get('item', [])
-            products = []
+            # Keyed by id so a listing repeated in the response is only returned once
+            products = {}
             for item in items:
-                title = item.get('title', '')
-                image_url = item.get('galleryURL', '')
-                source_link = item.get('viewItemURL', '')
-                price = float(item.get('sellingStatus', {}).get('currentPrice', {}).get('value', 0))
-                currency_id = item.get('sellingStatus', {}).get('currentPrice', {}).get('currencyId', 'USD')
+                get = item.get
+                title = get('title', '')
+                image_url = get('galleryURL', '')
+                source_link = get('viewItemURL', '')
+                current_price = (get('sellingStatus') or {}).get('currentPrice') or {}
+                price = float(current_price.get('value', 0))
+                currency_id = current_price.get('_currencyId', 'USD')  # XML attributes are prefixed with '_'
 
                 # Validate URLs
-                if not image_url.startswith(('http://', 'https://')):
+                if not image_url.startswith(HTTP_PREFIXES):
                     logger.warning(f"Invalid imageUrl for eBay item: '{title}'. Skipping.")
                     continue
-                if not source_link.startswith(('http://', 'https://')):
+                if not source_link.startswith(HTTP_PREFIXES):
                     logger.warning(f"Invalid sourceLink for eBay item: '{title}'. Skipping.")
                     continue
 
                 # Assign a unique ID by prefixing with 'ebay_'
-                item_id = item.get('itemId', '')
+                item_id = get('itemId', '')
                 unique_id = f"ebay_{item_id}"
+                if unique_id in products:
+                    continue
                 converted_price = price  # Assuming no conversion needed; handled in frontend if necessary
 
-                products.append({
+                products[unique_id] = {
                     'id': unique_id,
                     'title': title,
                     'price': converted_price,
@@ -72,12 +86,13 @@ class EbaySearcher:
                     'platform': 'eBay',
                     'imageUrl': image_url,
                     'sourceLink': source_link,
-                })
+                }
 
                 # Debug log for each product
-                logger.debug(f"[eBay] Item ID: {item_id}, Title: {title}, Price: {price} {currency_id}")
+                logger.debug("[eBay] Item ID: %s, Title: %s, Price: %s %s", item_id, title, price, currency_id)
 
-            logger.debug(f"[eBay] Parsed Products: {products}")
+            products = list(products.values())
+            logger.debug("[eBay] Parsed Products: %s", products)
             return products
         except ConnectionError as e:
             logger.error(f"[eBay] ConnectionError: {e}")
@@ -1,30 +1,59 @@
 # utils.py
 
-import re
+import io
 import logging
+from itertools import chain
+from functools import lru_cache
+from PIL import Image, ImageOps
 
+# URL schemes accepted for product images and source links
+HTTP_PREFIXES = ('http://', 'https://')
+
+class _DeletionTable(dict):
+    """
+    str.translate table that deletes every character `keep` rejects.
+    Entries are filled in on first sight of each character.
+    """
+    def __init__(self, keep):
+        super().__init__()
+        self._keep = keep
+
+    def __missing__(self, codepoint):
+        value = codepoint if self._keep(chr(codepoint)) else None
+        self[codepoint] = value
+        return value
+
+# Same character classes as the regexes [^\w\s] and [^\d.], without the regex engine
+_PUNCT_TABLE = _DeletionTable(lambda c: c.isalnum() or c == '_' or c.isspace())
+_PRICE_TABLE = _DeletionTable(lambda c: c.isdecimal() or c == '.')
+
+# Generic words dropped from search terms
+_GENERIC_TERMS = frozenset({'object', 'product', 'item', 'thing'})
+# Cleaned terms too broad to search on by themselves
+_REJECT_TERMS = frozenset({'shoe', 'sneaker', 'trainer', 'phone'})
+# Brands recognised by extract_brand_model
+_BRANDS = frozenset({'nike', 'adidas', 'puma', 'reebok', 'samsung', 'apple', 'sony'})
+
+@lru_cache(maxsize=4096)  # Pure, and the same Vision labels recur across requests
 def clean_search_term(term: str) -> str:
     """
     Clean the term by removing punctuation, limiting to first 2 words,
     and skipping generic words like 'object', 'item', etc.
     """
-    # Define some generic words to drop
-    generic_terms = {'object', 'product', 'item', 'thing'}
-
     # Remove non-alphanumeric except space
-    term = re.sub(r'[^\w\s]', '', term.lower())
+    term = term.lower().translate(_PUNCT_TABLE)
 
     # Split into words
     words = term.split()
 
     # Remove generic words
-    words = [w for w in words if w not in generic_terms]
+    words = [w for w in words if w not in _GENERIC_TERMS]
 
     # Keep only first 2 words and ensure they are specific
     cleaned = " ".join(words[:2]) if words else ""
     
     # Additional check to remove overly generic terms
-    if cleaned in {'shoe', 'sneaker', 'trainer', 'phone'}:
+    if cleaned in _REJECT_TERMS:
         return ""
     
     return cleaned
@@ -34,23 +63,46 @@ def extract_brand_model(vision_labels: list, web_entities: list) -> str:
     Extract brand and model information from Vision API results.
     Example use if you want to identify brand in the future.
     """
-    common_brands = ['nike', 'adidas', 'puma', 'reebok', 'samsung', 'apple', 'sony']
-    
-    # Look for brand names in both labels and web entities
-    brands = []
-    for term in vision_labels + web_entities:
-        term_lower = term.lower()
-        if any(brand in term_lower for brand in common_brands):
-            brands.append(term)
-    
-    return brands[0] if brands else None
+    # Look for brand names in both labels and web entities; whole words only,
+    # so 'pineapple' doesn't count as 'apple'
+    for term in chain(vision_labels, web_entities):
+        if not _BRANDS.isdisjoint(term.lower().split()):
+            return term
+
+    return None
 
 def clean_price(price_str: str) -> float:
     """Clean price strings to remove currency symbols and convert to standard format."""
-    cleaned_price = re.sub(r'[^\d.]', '', price_str)
+    cleaned_price = price_str.translate(_PRICE_TABLE)
     try:
         return float(cleaned_price)
     except ValueError:
         return 0.0
 
+def downscale_image(content: bytes, max_side: int = 1024) -> bytes:
+    """
+    Shrink an uploaded image so its longest side is at most max_side and re-encode it as JPEG.
+    Falls back to the original bytes if the image cannot be decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(content)) as im:
+            # Bake in the EXIF orientation, which the JPEG re-encode would otherwise drop
+            im = ImageOps.exif_transpose(im)
+            im.thumbnail((max_side, max_side), Image.LANCZOS)
+            if im.mode in ("RGBA", "LA", "P", "PA"):
+                # JPEG has no alpha; flatten onto white so transparent cut-outs
+                # (usually black under the alpha) don't become objects on black
+                rgba = im.convert("RGBA")
+                im = Image.new("RGB", rgba.size, (255, 255, 255))
+                im.paste(rgba, mask=rgba.getchannel("A"))
+            else:
+                im = im.convert("RGB")
+            out = io.BytesIO()
+            im.save(out, "JPEG", quality=85, optimize=True)
+    except Exception as e:
+        logger.warning(f"Could not downscale image, using original bytes: {e}")
+        return content
+    # Small, already-compressed uploads can come out larger after re-encoding
+    return out.getvalue() if out.tell() < len(content) else content
+
 logger = logging.getLogger(__name__)